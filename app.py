@@ -1,26 +1,63 @@
+# Patch blocking stdlib calls (sockets, sleep, ...) before anything else is
+# imported so concurrent requests yield to each other instead of blocking
+from gevent import monkey
+monkey.patch_all()
+
 import os
+import gc
 import logging
 import json
-import time
 from datetime import datetime
+import orjson
 from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask.json.provider import DefaultJSONProvider
+from gevent.pywsgi import WSGIServer
 from knowledge_base import KnowledgeBase
 from nlp_processor import NLPProcessor
+from conversation_store import create_conversation_store
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that uses orjson, which is much faster than the stdlib encoder."""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key")
+app.json = OrjsonProvider(app)
 
-# Initialize knowledge base and NLP processor
+# Initialize knowledge base and NLP processor. Gunicorn runs with --preload,
+# so this happens once in the master and workers are forked from it
 knowledge_base = KnowledgeBase("knowledge_data.txt")
 nlp_processor = NLPProcessor()
 
-# Store conversation history
-conversation_history = {}
+# Keep the garbage collector from touching the objects loaded so far, so the
+# forked workers keep sharing those memory pages copy-on-write
+gc.freeze()
+
+# Store conversation history (in Redis when REDIS_URL is set)
+conversation_history = create_conversation_store()
+
+def _json():
+    """
+    Parse the JSON body of the current request with orjson.
+    
+    Skips Flask's content-type check and cached text decode; all POST
+    endpoints here only ever receive small JSON payloads.
+    """
+    return orjson.loads(request.get_data(cache=False) or b'{}')
+
+# Simulated "thinking" delay (better UX), applied client-side before the
+# response is revealed so no worker is held for it
+THINKING_DELAY_MS = 500
 
 @app.route('/')
 def index():
@@ -30,38 +67,33 @@ def index():
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """Process chat messages and return responses."""
+    # One timestamp per request keeps every record of it consistent
+    now_iso = datetime.now().isoformat()
     try:
-        data = request.get_json()
+        data = _json()
         if not data or 'message' not in data:
             return jsonify({'error': 'No message provided'}), 400
         
         user_message = data['message']
         session_id = data.get('session_id', 'default')
         
-        # Initialize or retrieve conversation history for this session
-        if session_id not in conversation_history:
-            conversation_history[session_id] = []
-        
-        # Add user message to history
-        conversation_history[session_id].append({
+        # Add user message to history (starts the session if needed)
+        conversation_history.append(session_id, {
             'role': 'user', 
             'content': user_message,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': now_iso
         })
         
-        # Detect user intent
-        intent = nlp_processor.detect_intent(user_message)
-        
-        # Process the user message
-        processed_query = nlp_processor.preprocess(user_message)
+        # Process the user message, detecting its intent and extracting keywords
+        # for better context understanding
+        analysis = nlp_processor.analyze(user_message)
+        intent = analysis['intent']
+        processed_query = analysis['tokens']
         logger.debug(f"Processed query: {processed_query}")
-        
-        # Extract keywords for better context understanding
-        keywords = nlp_processor.extract_keywords(user_message)
-        logger.debug(f"Extracted keywords: {keywords}")
+        logger.debug(f"Extracted keywords: {analysis['keywords']}")
         
         # Get response based on the processed query and conversation context
-        context = conversation_history[session_id][-5:] if len(conversation_history[session_id]) > 5 else conversation_history[session_id]
+        context = conversation_history.get_recent(session_id, 5)
         response = knowledge_base.get_response(processed_query, context)
         
         # If no relevant response found
@@ -76,19 +108,17 @@ def chat():
                 response = "I'm sorry, I don't have information about that in my knowledge base. Please try asking something else or rephrasing your question."
         
         # Add bot response to history
-        conversation_history[session_id].append({
+        conversation_history.append(session_id, {
             'role': 'bot', 
             'content': response,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': now_iso
         })
         
-        # Add a small delay to simulate thinking (better UX)
-        time.sleep(0.5)
-        
         return jsonify({
             'response': response,
             'session_id': session_id,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': now_iso,
+            'thinking_ms': THINKING_DELAY_MS
         })
     
     except Exception as e:
@@ -99,11 +129,10 @@ def chat():
 def reset_conversation():
     """Reset the conversation history for a session."""
     try:
-        data = request.get_json()
+        data = _json()
         session_id = data.get('session_id', 'default')
         
-        if session_id in conversation_history:
-            conversation_history[session_id] = []
+        conversation_history.reset(session_id)
         
         return jsonify({
             'status': 'success', 
@@ -119,14 +148,14 @@ def reset_conversation():
 def export_conversation():
     """Export a conversation history as JSON."""
     try:
-        data = request.get_json()
+        data = _json()
         session_id = data.get('session_id')
         
-        if not session_id or session_id not in conversation_history:
+        if not session_id or not conversation_history.exists(session_id):
             return jsonify({'error': 'Conversation not found'}), 404
         
         # Get the conversation history for this session
-        history = conversation_history[session_id]
+        history = conversation_history.get_history(session_id)
         
         return jsonify({
             'status': 'success',
@@ -142,7 +171,7 @@ def export_conversation():
 def add_knowledge():
     """Add a new entry to the knowledge base (could be protected with authentication in production)."""
     try:
-        data = request.get_json()
+        data = _json()
         if not data or 'question' not in data or 'answer' not in data:
             return jsonify({'error': 'Missing required fields'}), 400
         
@@ -183,4 +212,9 @@ def server_error(e):
     return jsonify({'error': 'Server error'}), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # For production, run under Gunicorn with a gevent worker instead:
+    #   gunicorn -k gevent --preload --bind 0.0.0.0:5000 main:app
+    # One gevent worker serves many requests concurrently. Only add workers
+    # (-w) with REDIS_URL set, and note that knowledge added through the API
+    # is still only seen by the worker that handled it until a restart
+    WSGIServer(('0.0.0.0', 5000), app).serve_forever()
@@ -0,0 +1,170 @@
+import os
+import json
+import logging
+import threading
+from collections import deque
+from itertools import islice
+
+class ConversationStore:
+    """
+    Stores conversation history per session in the memory of the current process.
+    History is lost on restart and is not shared between worker processes; use
+    RedisConversationStore when running more than one worker. Each session keeps
+    only its latest messages so memory use per session stays bounded.
+
+    Sessions are guarded by a fixed set of striped locks, so concurrent requests
+    for different sessions rarely contend while updates to one session stay
+    consistent.
+    """
+
+    def __init__(self, max_messages=20, lock_stripes=32):
+        """
+        Initialize an empty in-memory store.
+
+        Args:
+            max_messages (int): Number of messages kept per session
+            lock_stripes (int): Number of locks sessions are spread over
+        """
+        self.conversations = {}
+        self.max_messages = max_messages
+        self._locks = [threading.Lock() for _ in range(lock_stripes)]
+
+    def _lock(self, session_id):
+        return self._locks[hash(session_id) % len(self._locks)]
+
+    def append(self, session_id, message):
+        """
+        Append a message to a session's history, creating the session if needed.
+
+        Args:
+            session_id (str): The session identifier
+            message (dict): The message to store
+        """
+        with self._lock(session_id):
+            history = self.conversations.get(session_id)
+            if history is None:
+                history = self.conversations[session_id] = deque(maxlen=self.max_messages)
+            history.append(message)
+
+    def get_recent(self, session_id, n):
+        """
+        Get the most recent messages of a session.
+
+        Args:
+            session_id (str): The session identifier
+            n (int): Maximum number of messages to return
+
+        Returns:
+            list: Up to n messages, oldest first
+        """
+        with self._lock(session_id):
+            history = self.conversations.get(session_id)
+            if not history:
+                return []
+            return list(islice(history, max(0, len(history) - n), None))
+
+    def get_history(self, session_id):
+        """
+        Get the full history of a session.
+
+        Args:
+            session_id (str): The session identifier
+
+        Returns:
+            list: All stored messages, oldest first
+        """
+        with self._lock(session_id):
+            return list(self.conversations.get(session_id, ()))
+
+    def exists(self, session_id):
+        """Check whether a session has been started."""
+        return session_id in self.conversations
+
+    def reset(self, session_id):
+        """Clear the history of a session."""
+        with self._lock(session_id):
+            if session_id in self.conversations:
+                self.conversations[session_id].clear()
+
+
+class RedisConversationStore:
+    """
+    Stores conversation history in Redis lists keyed by session, so it survives
+    restarts and is shared by every worker. Each session keeps only its latest
+    messages and expires after a period of inactivity.
+
+    Requires the optional `redis` package.
+    """
+
+    def __init__(self, url, max_messages=20, ttl=3600):
+        """
+        Connect to Redis.
+
+        Args:
+            url (str): Redis connection URL, e.g. redis://localhost:6379/0
+            max_messages (int): Number of messages kept per session
+            ttl (int): Seconds of inactivity before a session expires
+        """
+        import redis
+
+        # from_url sets up a connection pool shared by all requests
+        self.redis = redis.Redis.from_url(url)
+        self.max_messages = max_messages
+        self.ttl = ttl
+
+    def _key(self, session_id):
+        return f"conv:{session_id}"
+
+    def _reset_key(self, session_id):
+        # Redis drops empty lists, so a reset session is remembered by this
+        # marker until it expires
+        return f"conv:{session_id}:reset"
+
+    def append(self, session_id, message):
+        """Append a message to a session's history, trimming old messages."""
+        key = self._key(session_id)
+        pipe = self.redis.pipeline()
+        pipe.rpush(key, json.dumps(message))
+        pipe.ltrim(key, -self.max_messages, -1)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def get_recent(self, session_id, n):
+        """Get up to n of the most recent messages of a session, oldest first."""
+        items = self.redis.lrange(self._key(session_id), -n, -1)
+        return [json.loads(item) for item in items]
+
+    def get_history(self, session_id):
+        """Get all stored messages of a session, oldest first."""
+        items = self.redis.lrange(self._key(session_id), 0, -1)
+        return [json.loads(item) for item in items]
+
+    def exists(self, session_id):
+        """Check whether a session has been started, including sessions that were reset."""
+        return bool(self.redis.exists(self._key(session_id), self._reset_key(session_id)))
+
+    def reset(self, session_id):
+        """Clear the history of a session, keeping the session itself."""
+        if not self.exists(session_id):
+            return
+        pipe = self.redis.pipeline()
+        pipe.delete(self._key(session_id))
+        pipe.set(self._reset_key(session_id), 1, ex=self.ttl)
+        pipe.execute()
+
+
+def create_conversation_store():
+    """
+    Create the conversation store configured for this process.
+
+    Uses Redis when the REDIS_URL environment variable is set, and an
+    in-process store otherwise.
+
+    Returns:
+        ConversationStore or RedisConversationStore: The conversation store
+    """
+    redis_url = os.environ.get("REDIS_URL")
+    if redis_url:
+        logging.getLogger(__name__).info("Storing conversation history in Redis")
+        return RedisConversationStore(redis_url)
+    return ConversationStore()
@@ -1,10 +1,40 @@
 import os
+import sys
 import json
 import logging
 import re
 import math
 import time
-from collections import defaultdict
+import heapq
+import pickle
+import tempfile
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass
+from operator import itemgetter
+
+_WORD_RE = re.compile(r'\w+')
+_NON_WORD_RE = re.compile(r'[^\w\s]')
+
+# Version of the parsed-data cache layout; bump it whenever the entries or
+# indices change shape so stale caches are rebuilt instead of loaded
+_CACHE_VERSION = 3
+
+# Tags up to this length have their substrings indexed. Longer tags are rare
+# and would add O(L^2) substrings each, so they are matched by a scan instead
+_MAX_INDEXED_TAG_LEN = 32
+
+@dataclass(slots=True)
+class Entry:
+    """A knowledge base entry along with the per-entry data used when scoring queries."""
+    question: str
+    answer: str
+    tags: list
+    question_words: frozenset  # Lowercased question words longer than 2 characters
+    question_mask: int  # Bitmask of question_words
+    keyword_mask: int  # Bitmask of all question keywords, short words included
+    keyword_count: int  # Number of question keywords, short words included
+    term_freqs: dict  # Normalized frequency of each question word longer than 2 characters
+    created_at: float
 
 class KnowledgeBase:
     """
@@ -24,14 +54,23 @@ class KnowledgeBase:
         """Initialize the knowledge base with the given file path."""
         self.file_path = file_path
         self.data = []
-        self.keyword_index = defaultdict(list)
-        self.tag_index = defaultdict(list)
+        self.keyword_index = defaultdict(set)
+        self.short_word_index = defaultdict(set)  # Question keywords of 1-2 characters
+        self.tag_index = defaultdict(set)
+        self.tag_substrings = defaultdict(set)  # Tags containing each substring of 3+ characters
+        self.max_tag_len = 0  # Length of the longest tag in tag_substrings
+        self.long_tags = set()  # Tags too long to have their substrings indexed
+        self.word_bits = {}  # Bit position of each question word in the entry masks
+        self.idf = {}  # Inverse document frequency of each indexed keyword
         self.logger = logging.getLogger(__name__)
         
-        # Cache to store frequent queries
-        self.response_cache = {}
+        # Cache to store frequent queries, ordered from least to most recently used
+        self.response_cache = OrderedDict()
         self.cache_limit = 100  # Maximum number of cached responses
         
+        # Append handle for new entries, opened on first use and kept open
+        self._append_file = None
+        
         # Load knowledge base data
         self.load_data()
     
@@ -41,55 +80,37 @@ class KnowledgeBase:
             if not os.path.exists(self.file_path):
                 self.logger.warning(f"Knowledge base file {self.file_path} not found. Creating a new one.")
                 self._create_default_knowledge_base()
-                
-            with open(self.file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-                
-            # Split the content by the separator
-            entries = content.split('---')
             
+            # Reuse the entries and indices parsed on a previous start if the
+            # file hasn't changed since
+            if self._load_cache():
+                self.logger.info(f"Loaded {len(self.data)} entries from knowledge base cache")
+                return
+                
             # Clear existing data and indices
             self.data = []
-            self.keyword_index = defaultdict(list)
-            self.tag_index = defaultdict(list)
+            self.keyword_index = defaultdict(set)
+            self.short_word_index = defaultdict(set)
+            self.tag_index = defaultdict(set)
+            self.tag_substrings = defaultdict(set)
+            self.max_tag_len = 0
+            self.long_tags = set()
+            self.word_bits = {}
             
-            for entry in entries:
-                if not entry.strip():
-                    continue
-                
-                # Parse entry fields
-                question_match = re.search(r'QUESTION:(.*?)(?=ANSWER:|$)', entry, re.DOTALL)
-                answer_match = re.search(r'ANSWER:(.*?)(?=TAGS:|$)', entry, re.DOTALL)
-                tags_match = re.search(r'TAGS:(.*?)(?=$)', entry, re.DOTALL)
-                
-                if question_match and answer_match:
-                    question = question_match.group(1).strip()
-                    answer = answer_match.group(1).strip()
-                    tags = tags_match.group(1).strip().split(',') if tags_match else []
-                    tags = [tag.strip().lower() for tag in tags]
-                    
-                    entry_data = {
-                        'question': question,
-                        'answer': answer,
-                        'tags': tags,
-                        'created_at': time.time()
-                    }
-                    
-                    self.data.append(entry_data)
-                    current_idx = len(self.data) - 1
-                    
-                    # Index keywords from question for faster retrieval
-                    keywords = self._extract_keywords(question)
-                    
-                    # Create keyword index
-                    for keyword in keywords:
-                        if len(keyword) > 2:  # Only index keywords longer than 2 characters
-                            self.keyword_index[keyword].append(current_idx)
-                    
-                    # Create tag index
-                    for tag in tags:
-                        if tag:
-                            self.tag_index[tag].append(current_idx)
+            # Stream the file one entry at a time, parsing each entry when its
+            # separator line is reached, so only one entry is held in memory
+            buffer = []
+            with open(self.file_path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    if line.strip() == '---':
+                        self._parse_entry(''.join(buffer))
+                        buffer.clear()
+                    else:
+                        buffer.append(line)
+            self._parse_entry(''.join(buffer))
+            
+            self._update_idf()
+            self._save_cache()
             
             self.logger.info(f"Loaded {len(self.data)} entries from knowledge base")
             
@@ -98,11 +119,162 @@ class KnowledgeBase:
             # Create a default knowledge base if loading fails
             self._create_default_knowledge_base()
     
+    def _cache_key(self):
+        """Identify the current version of the knowledge base file."""
+        stat = os.stat(self.file_path)
+        return (_CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+    
+    def _load_cache(self):
+        """
+        Restore the parsed entries and indices from the cache file next to the
+        knowledge base file.
+        
+        Returns:
+            bool: True if the cache matched the current file and was loaded
+        """
+        try:
+            with open(self.file_path + '.pkl', 'rb') as file:
+                cached = pickle.load(file)
+            if cached['key'] != self._cache_key():
+                return False
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable knowledge base cache: {str(e)}")
+            return False
+        
+        self.data = cached['data']
+        self.keyword_index = cached['keyword_index']
+        self.short_word_index = cached['short_word_index']
+        self.tag_index = cached['tag_index']
+        self.tag_substrings = cached['tag_substrings']
+        self.max_tag_len = cached['max_tag_len']
+        self.long_tags = cached['long_tags']
+        self.word_bits = cached['word_bits']
+        self.idf = cached['idf']
+        return True
+    
+    def _save_cache(self):
+        """Write the parsed entries and indices to the cache file next to the knowledge base file."""
+        cache_path = self.file_path + '.pkl'
+        try:
+            cached = {
+                'key': self._cache_key(),
+                'data': self.data,
+                'keyword_index': self.keyword_index,
+                'short_word_index': self.short_word_index,
+                'tag_index': self.tag_index,
+                'tag_substrings': self.tag_substrings,
+                'max_tag_len': self.max_tag_len,
+                'long_tags': self.long_tags,
+                'word_bits': self.word_bits,
+                'idf': self.idf
+            }
+            # Write to a temporary file of this process first so a concurrent
+            # start never reads or overwrites a partially written cache
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path) or '.')
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    pickle.dump(cached, file, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, cache_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            self.logger.warning(f"Could not write knowledge base cache: {str(e)}")
+    
+    def _parse_entry(self, entry):
+        """Parse the text of a single entry and add it to the data and indices."""
+        if not entry.strip():
+            return
+        
+        # Parse entry fields by splitting on each marker in turn: QUESTION, ANSWER
+        # and optional TAGS. Entries without a question and answer are skipped
+        _, has_question, rest = entry.partition('QUESTION:')
+        question, has_answer, rest = rest.partition('ANSWER:')
+        
+        if has_question and has_answer:
+            answer, has_tags, tags = rest.partition('TAGS:')
+            question = question.strip()
+            answer = answer.strip()
+            tags = tags.strip().split(',') if has_tags else []
+            tags = [tag.strip().lower() for tag in tags]
+            
+            entry_data = self._build_entry(question, answer, tags)
+            
+            self.data.append(entry_data)
+            current_idx = len(self.data) - 1
+            
+            # Index keywords from question for faster retrieval
+            keywords = self._extract_keywords(question)
+            
+            # Create keyword index
+            for keyword in keywords:
+                if len(keyword) > 2:  # Only index keywords longer than 2 characters
+                    self.keyword_index[keyword].add(current_idx)
+                else:
+                    # Short words only matter for finding similar questions
+                    self.short_word_index[keyword].add(current_idx)
+            
+            # Create tag index
+            for tag in tags:
+                if tag:
+                    self._index_tag(tag, current_idx)
+    
+    def _index_tag(self, tag, idx):
+        """Add an entry to a tag's postings, indexing the substrings of tags not seen before."""
+        if tag not in self.tag_index:
+            if len(tag) > _MAX_INDEXED_TAG_LEN:
+                self.long_tags.add(tag)
+            else:
+                self.max_tag_len = max(self.max_tag_len, len(tag))
+                
+                # Keywords are longer than 2 characters, so shorter substrings
+                # can never match one
+                for start in range(len(tag) - 2):
+                    for end in range(start + 3, len(tag) + 1):
+                        self.tag_substrings[tag[start:end]].add(tag)
+        
+        self.tag_index[tag].add(idx)
+    
+    def _build_entry(self, question, answer, tags):
+        """Create an entry along with the per-entry data used when scoring queries."""
+        question_words = frozenset(word.lower() for word in _WORD_RE.findall(question)
+                                   if len(word) > 2)
+        
+        # Encode the question words as a bitmask so overlaps with a query are a
+        # single AND + popcount, assigning bits to new words as they appear
+        question_mask = 0
+        for word in question_words:
+            bit = self.word_bits.setdefault(word, len(self.word_bits))
+            question_mask |= 1 << bit
+        
+        # The same encoding for every keyword of the question, short words
+        # included, used when looking for similar questions
+        keywords = self._extract_keywords(question)
+        keyword_mask = 0
+        for word in keywords:
+            bit = self.word_bits.setdefault(word, len(self.word_bits))
+            keyword_mask |= 1 << bit
+        
+        return Entry(
+            question=question,
+            answer=answer,
+            # Tags repeat across many entries, so share one string per tag
+            tags=[sys.intern(tag) for tag in tags],
+            question_words=question_words,
+            question_mask=question_mask,
+            keyword_mask=keyword_mask,
+            keyword_count=len(keywords),
+            term_freqs=self._calculate_term_frequencies(question),
+            created_at=time.time()
+        )
+    
     def _extract_keywords(self, text):
         """Extract keywords from text for indexing."""
         # Convert to lowercase and remove punctuation
         text = text.lower()
-        text = re.sub(r'[^\w\s]', ' ', text)
+        text = _NON_WORD_RE.sub(' ', text)
         
         # Split into words and filter
         words = text.split()
@@ -110,22 +282,22 @@ class KnowledgeBase:
         # Return unique keywords
         return set(words)
     
-    def _calculate_idf(self, term):
-        """Calculate Inverse Document Frequency (IDF) for a term."""
+    def _update_idf(self):
+        """Recalculate the Inverse Document Frequency (IDF) of every indexed keyword."""
         doc_count = len(self.data)
-        term_doc_count = len(self.keyword_index.get(term, [])) or 1
-        return math.log(doc_count / term_doc_count) + 1
+        self.idf = {term: math.log(doc_count / (len(postings) or 1)) + 1
+                    for term, postings in self.keyword_index.items()}
     
-    def _calculate_term_frequency(self, term, text):
-        """Calculate normalized term frequency."""
+    def _calculate_term_frequencies(self, text):
+        """Calculate normalized term frequencies for every indexable word in the text."""
         text_lower = text.lower()
-        words = re.findall(r'\w+', text_lower)
-        term_count = sum(1 for word in words if word == term)
+        words = _WORD_RE.findall(text_lower)
         
         if not words:
-            return 0
+            return {}
         
-        return term_count / len(words)
+        return {word: count / len(words)
+                for word, count in Counter(words).items() if len(word) > 2}
     
     def _create_default_knowledge_base(self):
         """Create a default knowledge base with some example entries."""
@@ -164,85 +336,115 @@ TAGS: creator, origin, development
         if not query:
             return None
         
-        # Check cache first for exact query match (as a string)
-        cache_key = ' '.join(query)
-        if cache_key in self.response_cache:
-            return self.response_cache[cache_key]
-        
         # Convert query tokens to a set of unique keywords
         query_keywords = set([word.lower() for word in query if len(word) > 2])
         
-        # Calculate relevance scores for each entry using TF-IDF weighting
+        # Check cache first. Scoring only depends on the set of keywords, so
+        # keying on it lets reworded queries (different order, casing, short
+        # filler words) reuse a cached answer. Queries without keywords are
+        # answered from context alone and are never cached
+        cache_key = frozenset(query_keywords)
+        if cache_key and cache_key in self.response_cache:
+            self.response_cache.move_to_end(cache_key)
+            return self.response_cache[cache_key]
+        
+        # Walk each keyword's posting list once, counting keyword matches and
+        # accumulating TF-IDF scores, i.e. a sparse matrix-vector product over
+        # the index; entries that don't contain a keyword score zero for it
+        keyword_matches = defaultdict(int)
+        tfidf_scores = defaultdict(float)
+        for keyword in query_keywords:
+            postings = self.keyword_index.get(keyword)
+            if not postings:
+                continue
+            
+            idf = self.idf[keyword]
+            for idx in postings:
+                keyword_matches[idx] += 1
+                tfidf_scores[idx] += self.data[idx].term_freqs.get(keyword, 0) * idf
+        
+        # Weight each tag matching the query: tags contained in a keyword are
+        # found by looking up the keyword's substrings no longer than any
+        # indexed tag, and tags containing a keyword through the substring
+        # index. The few long tags are checked directly
+        tag_weights = {}
+        for keyword in query_keywords:
+            for start in range(len(keyword)):
+                for end in range(start + 1, min(start + self.max_tag_len, len(keyword)) + 1):
+                    if keyword[start:end] in self.tag_index:
+                        tag_weights[keyword[start:end]] = 2  # Weight tag matches higher
+            if len(keyword) <= self.max_tag_len:
+                for tag in self.tag_substrings.get(keyword, ()):
+                    tag_weights.setdefault(tag, 1.5)  # Partial tag matches
+            for tag in self.long_tags:
+                if tag in keyword:
+                    tag_weights[tag] = 2
+                elif keyword in tag:
+                    tag_weights.setdefault(tag, 1.5)
+        
+        # Sum the weights of each entry's matching tags
+        tag_scores = defaultdict(float)
+        for tag, weight in tag_weights.items():
+            for idx in self.tag_index[tag]:
+                tag_scores[idx] += weight
+        
+        # Only entries reachable through the indexes can score above zero:
+        # keyword postings, entries whose tags match a query keyword, and
+        # entries matching words from the conversation context
+        candidate_idxs = set(keyword_matches)
+        candidate_idxs.update(tag_scores)
+        
+        # Score context from previous messages once, not once per entry, by
+        # walking the postings of each context word
+        context_scores = defaultdict(float)
+        if context:
+            for i, message in enumerate(context):
+                if message.get('role') == 'user' and 'content' in message:
+                    # Extract words from user messages
+                    context_words = set([word.lower() for word in 
+                                       _WORD_RE.findall(message['content']) 
+                                       if len(word) > 2])
+                    
+                    # Add recency weighting (more recent messages have higher weight)
+                    recency_factor = min(1.0, 0.5 + (i / len(context)))
+                    
+                    for word in context_words:
+                        for idx in self.keyword_index.get(word, ()):
+                            # Boost score based on context relevance with recency factor
+                            context_scores[idx] += 0.3 * recency_factor
+            
+            candidate_idxs.update(context_scores)
+        
+        # Bitmask of the query keywords that occur in any question
+        query_mask = 0
+        for keyword in query_keywords:
+            bit = self.word_bits.get(keyword)
+            if bit is not None:
+                query_mask |= 1 << bit
+        
+        # Calculate relevance scores for each candidate using TF-IDF weighting,
+        # in index order so ties resolve the same way as a full scan
         scores = []
-        for idx, entry in enumerate(self.data):
-            # Initialize the score
-            base_score = 0
-            tfidf_score = 0
-            tag_score = 0
-            question_similarity_score = 0
-            context_score = 0
+        for idx in sorted(candidate_idxs):
+            entry = self.data[idx]
             
-            # Score based on TF-IDF for each keyword in the query
-            for keyword in query_keywords:
-                if len(keyword) <= 2:
-                    continue
-                
-                # Calculate TF-IDF score
-                idf = self._calculate_idf(keyword)
-                tf = self._calculate_term_frequency(keyword, entry['question'])
-                tfidf = tf * idf
-                
-                # Add to the total TF-IDF score
-                tfidf_score += tfidf
-                
-                # Boost score for direct keyword matches in the index
-                if idx in self.keyword_index.get(keyword, []):
-                    base_score += 1
+            # Initialize the score; direct keyword matches in the index boost it
+            base_score = keyword_matches.get(idx, 0)
+            tfidf_score = tfidf_scores.get(idx, 0)
+            tag_score = tag_scores.get(idx, 0)
+            question_similarity_score = 0
+            context_score = context_scores.get(idx, 0)
             
             # Score based on question similarity using Jaccard similarity
-            entry_question_words = set([word.lower() for word in 
-                                      re.findall(r'\w+', entry['question']) 
-                                      if len(word) > 2])
+            entry_question_words = entry.question_words
             
             if entry_question_words:
-                intersection = len(query_keywords.intersection(entry_question_words))
-                union = len(query_keywords.union(entry_question_words))
+                intersection = (query_mask & entry.question_mask).bit_count()
+                union = len(query_keywords) + len(entry_question_words) - intersection
                 if union > 0:
                     similarity = intersection / union
                     question_similarity_score = similarity * 3  # Weight this higher
             
-            # Score based on tag matches
-            for tag in entry['tags']:
-                if any(tag in keyword for keyword in query_keywords):
-                    tag_score += 2  # Weight tag matches higher
-                elif any(keyword in tag for keyword in query_keywords):
-                    tag_score += 1.5  # Partial tag matches
-            
-            # Consider context if provided
-            if context:
-                # Extract context from previous messages
-                context_keywords = set()
-                for i, message in enumerate(context):
-                    if message.get('role') == 'user' and 'content' in message:
-                        # Extract words from user messages
-                        context_words = set([word.lower() for word in 
-                                           re.findall(r'\w+', message['content']) 
-                                           if len(word) > 2])
-                        
-                        # Add recency weighting (more recent messages have higher weight)
-                        recency_factor = min(1.0, 0.5 + (i / len(context)))
-                        
-                        for word in context_words:
-                            if idx in self.keyword_index.get(word, []):
-                                # Boost score based on context relevance with recency factor
-                                context_score += 0.3 * recency_factor
-                
-                # Boost entries that match the current conversation topic
-                if context_keywords:
-                    for keyword in context_keywords:
-                        if idx in self.keyword_index.get(keyword, []):
-                            context_score += 0.2
-            
             # Calculate total score with different weights for each component
             total_score = (
                 base_score * 1.0 +
@@ -254,28 +456,32 @@ TAGS: creator, origin, development
             
             scores.append((idx, total_score))
         
-        # Sort by score in descending order
-        scores.sort(key=lambda x: x[1], reverse=True)
-        
-        self.logger.debug(f"Query: {query}, Top scores: {scores[:3]}")
+        # Select the top scores without sorting every candidate. Only the best
+        # one is used, so the top three are only gathered for debug logging
+        if self.logger.isEnabledFor(logging.DEBUG):
+            top_scores = heapq.nlargest(3, scores, key=itemgetter(1))
+            self.logger.debug(f"Query: {query}, Top scores: {top_scores}")
+        else:
+            top_scores = [max(scores, key=itemgetter(1))] if scores else []
         
         # Return the answer of the highest-scoring entry if it meets a minimum threshold
-        if scores and scores[0][1] > 0.8:  # Higher threshold for better precision
-            best_match_idx = scores[0][0]
-            answer = self.data[best_match_idx]['answer']
+        if top_scores and top_scores[0][1] > 0.8:  # Higher threshold for better precision
+            best_match_idx = top_scores[0][0]
+            answer = self.data[best_match_idx].answer
             
             # Cache the result for future queries
-            if len(self.response_cache) >= self.cache_limit:
-                # Remove a random key if cache is full
-                self.response_cache.pop(next(iter(self.response_cache)))
-            self.response_cache[cache_key] = answer
+            if cache_key:
+                self.response_cache[cache_key] = answer
+                if len(self.response_cache) > self.cache_limit:
+                    # Evict the least recently used response
+                    self.response_cache.popitem(last=False)
             
             return answer
         
         # Handle "almost" matches with a lower threshold for recall
-        elif scores and scores[0][1] > 0.5:
-            best_match_idx = scores[0][0]
-            return self.data[best_match_idx]['answer']
+        elif top_scores and top_scores[0][1] > 0.5:
+            best_match_idx = top_scores[0][0]
+            return self.data[best_match_idx].answer
         
         return None
     
@@ -291,63 +497,109 @@ TAGS: creator, origin, development
         Returns:
             bool: True if the entry was added successfully, False otherwise
         """
-        if not tags:
-            tags = []
+        return self.add_entries([(question, answer, tags)]) == 1
+    
+    def add_entries(self, entries):
+        """
+        Add several entries to the knowledge base at once.
+        
+        The whole batch is written to the file in one write, and the IDF table
+        and response cache are updated once, so importing many entries costs
+        far less than calling add_entry for each of them.
+        
+        Args:
+            entries (list): List of (question, answer, tags) tuples, where tags
+                may be None
+            
+        Returns:
+            int: Number of entries added; duplicate questions are skipped
+        """
+        first_idx = len(self.data)
         
         try:
-            # Create the new entry
-            entry = {
-                'question': question,
-                'answer': answer,
-                'tags': tags,
-                'created_at': time.time()
-            }
+            # Questions already present, to avoid exact duplicates
+            existing_questions = {entry.question.lower() for entry in self.data}
             
-            # Check for duplicate questions (avoid exact duplicates)
-            for existing_entry in self.data:
-                if existing_entry['question'].lower() == question.lower():
+            records = []
+            for question, answer, tags in entries:
+                # Normalize tags the way tags read from the file are, so the
+                # entry, the index and the written record all agree
+                tags = [tag.strip().lower() for tag in tags or ()]
+                tags = [tag for tag in tags if tag]
+                
+                # Check for duplicate questions, including earlier ones in the batch
+                if question.lower() in existing_questions:
                     self.logger.warning(f"Duplicate question: {question}. Entry not added.")
-                    return False
-            
-            # Add to the data list
-            self.data.append(entry)
-            current_idx = len(self.data) - 1
+                    continue
+                existing_questions.add(question.lower())
+                
+                # Create the new entry and add it to the data list
+                self.data.append(self._build_entry(question, answer, tags))
+                current_idx = len(self.data) - 1
+                
+                # Extract and index keywords
+                keywords = self._extract_keywords(question)
+                for keyword in keywords:
+                    if len(keyword) > 2:
+                        self.keyword_index[keyword].add(current_idx)
+                    else:
+                        self.short_word_index[keyword].add(current_idx)
+                
+                # Index tags
+                for tag in tags:
+                    self._index_tag(tag, current_idx)
+                
+                records.append(f"\n---\nQUESTION: {question}\nANSWER: {answer}\nTAGS: {', '.join(tags)}\n")
             
-            # Extract and index keywords
-            keywords = self._extract_keywords(question)
-            for keyword in keywords:
-                if len(keyword) > 2:
-                    self.keyword_index[keyword].append(current_idx)
+            if not records:
+                return 0
             
-            # Index tags
-            for tag in tags:
-                tag = tag.lower().strip()
-                if tag:
-                    self.tag_index[tag].append(current_idx)
+            # The document count changed, so every keyword's IDF did too
+            self._update_idf()
             
-            # Save to file
+            # Save to file with a single buffered write, flushed so the entries
+            # are on disk before success is reported
             try:
-                with open(self.file_path, 'a', encoding='utf-8') as file:
-                    file.write("\n---\n")
-                    file.write(f"QUESTION: {question}\n")
-                    file.write(f"ANSWER: {answer}\n")
-                    file.write(f"TAGS: {', '.join(tags)}\n")
-                
-                # Clear cache since the knowledge base has changed
-                self.response_cache = {}
-                
-                self.logger.info(f"Added new entry: {question}")
-                return True
+                if self._append_file is None:
+                    self._append_file = open(self.file_path, 'a', buffering=1 << 16, encoding='utf-8')
+                self._append_file.write(''.join(records))
+                self._append_file.flush()
             
             except Exception as file_error:
                 self.logger.error(f"Error writing to file: {str(file_error)}")
-                # Rollback the addition
-                self.data.pop()
-                return False
+                self._remove_entries_from(first_idx)
+                return 0
+            
+            # Clear cache since the knowledge base has changed. Adding entries
+            # changes every IDF, so any cached answer may no longer be the best
+            self.response_cache.clear()
+            
+            for entry in self.data[first_idx:]:
+                self.logger.info(f"Added new entry: {entry.question}")
+            return len(records)
             
         except Exception as e:
             self.logger.error(f"Error adding entry to knowledge base: {str(e)}")
-            return False
+            self._remove_entries_from(first_idx)
+            return 0
+    
+    def _remove_entries_from(self, first_idx):
+        """Roll back the entries added from first_idx on, including their index postings."""
+        removed = set(range(first_idx, len(self.data)))
+        if not removed:
+            return
+        
+        del self.data[first_idx:]
+        for index in (self.keyword_index, self.short_word_index, self.tag_index):
+            for postings in index.values():
+                postings -= removed
+        self._update_idf()
+    
+    def close(self):
+        """Close the file handle used for appending new entries."""
+        if self._append_file is not None:
+            self._append_file.close()
+            self._append_file = None
     
     def search_by_tag(self, tag):
         """
@@ -357,15 +609,15 @@ TAGS: creator, origin, development
             tag (str): The tag to search for
             
         Returns:
-            list: List of entries with the specified tag
+            list: List of Entry objects with the specified tag
         """
         if not tag:
             return []
         
         tag = tag.lower().strip()
-        entry_indices = self.tag_index.get(tag, [])
+        entry_indices = self.tag_index.get(tag, ())
         
-        return [self.data[idx] for idx in entry_indices]
+        return [self.data[idx] for idx in sorted(entry_indices)]
     
     def get_all_tags(self):
         """
@@ -385,7 +637,7 @@ TAGS: creator, origin, development
             limit (int): Maximum number of results to return
             
         Returns:
-            list: List of matching entries
+            list: List of matching Entry objects
         """
         # Extract search keywords
         keywords = self._extract_keywords(query)
@@ -400,8 +652,8 @@ TAGS: creator, origin, development
             if len(keyword) <= 2:
                 continue
                 
-            matched_indices = self.keyword_index.get(keyword, [])
-            for idx in matched_indices:
+            matched_indices = self.keyword_index.get(keyword, ())
+            for idx in sorted(matched_indices):
                 entry_scores[idx] += 1
         
         # Sort by score
@@ -429,18 +681,32 @@ TAGS: creator, origin, development
         if not keywords:
             return []
         
-        # Calculate similarity for each entry
+        # Bitmask of the keywords that occur in any question
+        query_mask = 0
+        for keyword in keywords:
+            bit = self.word_bits.get(keyword)
+            if bit is not None:
+                query_mask |= 1 << bit
+        
+        # An entry above the similarity cut-off shares more than a fifth of the
+        # keywords, so it contains at least one of any len(keywords) - required + 1
+        # of them; only entries in the postings of the rarest ones are scored
+        required = len(keywords) // 5 + 1
+        postings = sorted((self.keyword_index.get(keyword, ()) if len(keyword) > 2
+                           else self.short_word_index.get(keyword, ())
+                           for keyword in keywords), key=len)
+        candidate_idxs = set().union(*postings[:len(keywords) - required + 1])
+        
+        # Calculate similarity for each candidate, in index order so ties
+        # resolve the same way as a full scan
         similarities = []
-        for idx, entry in enumerate(self.data):
-            entry_keywords = self._extract_keywords(entry['question'])
-            
-            # Skip entries with no keywords
-            if not entry_keywords:
-                continue
+        for idx in sorted(candidate_idxs):
+            entry = self.data[idx]
+            entry_keyword_count = entry.keyword_count
             
             # Calculate Jaccard similarity
-            intersection = len(keywords.intersection(entry_keywords))
-            union = len(keywords.union(entry_keywords))
+            intersection = (query_mask & entry.keyword_mask).bit_count()
+            union = len(keywords) + entry_keyword_count - intersection
             
             if union > 0:
                 similarity = intersection / union
@@ -454,7 +720,7 @@ TAGS: creator, origin, development
         similar_questions = []
         for idx, similarity in similarities[:limit]:
             similar_questions.append({
-                'question': self.data[idx]['question'],
+                'question': self.data[idx].question,
                 'similarity': similarity
             })
         
@@ -1,4 +1,5 @@
 from app import app
+from gevent.pywsgi import WSGIServer
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    WSGIServer(("0.0.0.0", 5000), app).serve_forever()
@@ -2,7 +2,10 @@ import re
 import string
 import logging
 import math
+import heapq
 from collections import Counter
+from functools import lru_cache
+from operator import itemgetter
 
 class NLPProcessor:
     """
@@ -11,28 +14,71 @@ class NLPProcessor:
     and semantic analysis for better query understanding.
     """
     
+    # Common English stopwords
+    _STOPWORDS = frozenset({
+        'a', 'an', 'the', 'and', 'but', 'or', 'because', 'as', 'until', 'while', 
+        'of', 'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into', 
+        'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 
+        'up', 'down', 'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further',
+        'then', 'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all', 'any',
+        'both', 'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 'nor',
+        'not', 'only', 'own', 'same', 'so', 'than', 'too', 'very', 's', 't', 'can',
+        'will', 'just', 'don', 'should', 'now', 'i', 'me', 'my', 'myself', 'we',
+        'our', 'ours', 'ourselves', 'you', 'your', 'yours', 'yourself', 'yourselves',
+        'he', 'him', 'his', 'himself', 'she', 'her', 'hers', 'herself', 'it', 'its',
+        'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which',
+        'who', 'whom', 'this', 'that', 'these', 'those', 'am', 'is', 'are', 'was',
+        'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does',
+        'did', 'doing', 'if'
+    })
+    
+    # Common contractions mapping
+    _CONTRACTIONS = {
+        "can't": "cannot",
+        "won't": "will not",
+        "n't": " not",
+        "'ve": " have",
+        "'re": " are",
+        "'m": " am",
+        "'ll": " will",
+        "'d": " would",
+        "'s": " is"
+    }
+    
+    # Matches any contraction in a single pass, trying longer ones first so
+    # "n't" doesn't shadow "can't" and "won't". Only ASCII letters fold case,
+    # matching what lowercasing the text first would give
+    _CONTRACTION_RE = re.compile('|'.join(map(re.escape, sorted(_CONTRACTIONS, key=len, reverse=True))),
+                                 re.IGNORECASE | re.ASCII)
+    
+    # Maps every ASCII punctuation character to a space
+    _PUNCT_TABLE = str.maketrans(string.punctuation, ' ' * len(string.punctuation))
+    
+    # Same as _PUNCT_TABLE, also mapping ASCII uppercase letters to lowercase
+    _LOWER_PUNCT_TABLE = str.maketrans(string.punctuation + string.ascii_uppercase,
+                                       ' ' * len(string.punctuation) + string.ascii_lowercase)
+    
+    # Date patterns for entity extraction, combined so the text is scanned once.
+    # Groups are non-capturing so every match is reported as the full date
+    _DATE_RE = re.compile(
+        r'\d{1,2}[-/]\d{1,2}[-/]\d{2,4}'  # DD/MM/YYYY or similar
+        r'|(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]* \d{1,2}(?:st|nd|rd|th)?,? \d{2,4}'  # Month Day, Year
+        r'|yesterday|today|tomorrow'  # Relative dates
+    )
+    
+    # Potential names: capitalized words not at the start of a sentence
+    _NAME_RE = re.compile(r'(?<!\. )[A-Z][a-z]+')
+    
+    # Recency weight of a context message by how many messages came after it,
+    # decaying by 0.1 per message down to the minimum weight of 0.1
+    _RECENCY_WEIGHTS = tuple(max(0.1, 1.0 - (0.1 * age)) for age in range(10))
+    
     def __init__(self):
         """Initialize the NLP processor with stopwords and other settings."""
         self.logger = logging.getLogger(__name__)
         
-        # Common English stopwords
-        self.stopwords = {
-            'a', 'an', 'the', 'and', 'but', 'or', 'because', 'as', 'until', 'while', 
-            'of', 'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into', 
-            'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 
-            'up', 'down', 'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further',
-            'then', 'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all', 'any',
-            'both', 'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 'nor',
-            'not', 'only', 'own', 'same', 'so', 'than', 'too', 'very', 's', 't', 'can',
-            'will', 'just', 'don', 'should', 'now', 'i', 'me', 'my', 'myself', 'we',
-            'our', 'ours', 'ourselves', 'you', 'your', 'yours', 'yourself', 'yourselves',
-            'he', 'him', 'his', 'himself', 'she', 'her', 'hers', 'herself', 'it', 'its',
-            'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which',
-            'who', 'whom', 'this', 'that', 'these', 'those', 'am', 'is', 'are', 'was',
-            'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does',
-            'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as',
-            'until', 'while'
-        }
+        # Common English stopwords, shared by all instances
+        self.stopwords = self._STOPWORDS
         
         # Intent patterns
         self.intent_patterns = {
@@ -70,12 +116,12 @@ class NLPProcessor:
             ]
         }
         
-        # Common question starters
-        self.question_starters = [
+        # Common question starters, as a tuple so str.startswith can test them all at once
+        self.question_starters = (
             'what', 'how', 'why', 'when', 'where', 'who', 'which', 'whose', 'whom',
             'can you', 'could you', 'would you', 'will you', 'should i', 'do you',
             'are there', 'is there', 'are you', 'is it'
-        ]
+        )
         
         # Domain-specific terms for better matching
         self.domain_terms = {
@@ -84,6 +130,74 @@ class NLPProcessor:
             'technical': ['code', 'programming', 'software', 'app', 'application', 'web'],
             'functionality': ['function', 'capability', 'feature', 'ability', 'can do']
         }
+        
+        # Keyword weight multiplier of each domain term, boosted 1.5x per domain it belongs to
+        self._domain_boost = {}
+        for terms in self.domain_terms.values():
+            for term in terms:
+                self._domain_boost[term] = self._domain_boost.get(term, 1.0) * 1.5
+        
+        # Words that negate the word following them
+        self.negation_triggers = frozenset({'not', 'no', 'never'})
+        
+        # Words that flip the sentiment of a message; contractions such as
+        # "don't" are expanded to "do not" before these are counted
+        self.sentiment_negations = frozenset({'not', 'no', 'never', 'cannot'})
+        
+        # Basic positive and negative words for sentiment analysis
+        self.positive_words = frozenset({
+            'good', 'great', 'excellent', 'amazing', 'wonderful', 'fantastic', 'helpful',
+            'useful', 'thank', 'thanks', 'appreciate', 'happy', 'glad', 'love', 'like',
+            'best', 'better', 'awesome', 'nice', 'well', 'positive', 'correct', 'right'
+        })
+        
+        self.negative_words = frozenset({
+            'bad', 'terrible', 'awful', 'horrible', 'poor', 'useless', 'unhelpful',
+            'wrong', 'hate', 'dislike', 'worst', 'worse', 'negative', 'error', 'fail',
+            'problem', 'issue', 'bug', 'difficult', 'hard', 'complicated', 'confused'
+        })
+        
+        # Action verbs reported as entities, in the order they are listed
+        self.action_verbs = (
+            'create', 'delete', 'update', 'add', 'remove', 'send', 'receive',
+            'build', 'design', 'develop', 'learn', 'explain', 'compare'
+        )
+        
+        # Memoize the analysis methods per instance, since users often repeat
+        # short messages and context messages are analyzed again on every turn.
+        # The public methods return copies so callers can't alter cached results
+        self._preprocess_cached = lru_cache(maxsize=4096)(self._preprocess)
+        self._extract_keywords_cached = lru_cache(maxsize=4096)(self._extract_keywords)
+        self._detect_intent_cached = lru_cache(maxsize=4096)(self._detect_intent)
+        self._analyze_sentiment_cached = lru_cache(maxsize=4096)(self._analyze_sentiment)
+        self._token_set_cached = lru_cache(maxsize=4096)(self._token_set)
+        
+        # Intent of every message that is exactly one of the patterns, such as
+        # "hi" or "thank you", so these common short messages skip the scan
+        self._pattern_intents = {
+            pattern: self._match_intent(pattern)
+            for patterns in self.intent_patterns.values() for pattern in patterns
+        }
+    
+    def analyze(self, text, n_keywords=5):
+        """
+        Analyze a chat message: preprocess it, extract its keywords and detect its intent.
+        
+        The analyses share a single preprocessing of the text, and each one is
+        served from the per-instance caches when the message was seen before.
+        
+        Args:
+            text (str): The input text
+            n_keywords (int): The number of keywords to extract
+            
+        Returns:
+            dict: The preprocessed 'tokens', the 'keywords' and the detected 'intent'
+        """
+        return {
+            'tokens': self.preprocess(text),
+            'keywords': self.extract_keywords(text, n_keywords),
+            'intent': self.detect_intent(text)
+        }
     
     def preprocess(self, text):
         """
@@ -101,12 +215,18 @@ class NLPProcessor:
         Returns:
             list: List of preprocessed tokens
         """
+        return list(self._preprocess_cached(text))
+    
+    def _preprocess(self, text):
+        """Preprocess text without the cache; see preprocess."""
         if not text:
             return []
         
         try:
-            # Convert to lowercase
-            text = text.lower()
+            # Convert to lowercase. ASCII text is lowercased below, in the same
+            # pass that removes punctuation; other text needs Unicode lowercasing
+            if not text.isascii():
+                text = text.lower()
             
             # Handle common contractions
             text = self._expand_contractions(text)
@@ -114,20 +234,32 @@ class NLPProcessor:
             # Preserve question marks for intent detection
             has_question_mark = '?' in text
             
-            # Remove punctuation but preserve words
-            text = re.sub(f'[{re.escape(string.punctuation)}]', ' ', text)
+            # Remove punctuation but preserve words, lowercasing ASCII letters
+            text = text.translate(self._LOWER_PUNCT_TABLE)
             
             # Tokenize (split by whitespace)
             tokens = text.split()
             
-            # Handle negations
-            negation_tokens = self._handle_negations(tokens)
+            negation_triggers = self.negation_triggers
+            stopwords = self.stopwords
             
-            # Remove stopwords (except for preserved negations)
-            filtered_tokens = []
-            for token in negation_tokens:
-                if '_not' in token or token not in self.stopwords:
-                    filtered_tokens.append(token)
+            if negation_triggers.isdisjoint(tokens):
+                # Without negations, only stopwords need removing
+                filtered_tokens = [token for token in tokens if token not in stopwords]
+            else:
+                # Handle negations by combining them with the following word, and
+                # remove stopwords (except for preserved negations) in the same pass
+                filtered_tokens = []
+                i = 0
+                while i < len(tokens):
+                    token = tokens[i]
+                    if token in negation_triggers and i + 1 < len(tokens):
+                        filtered_tokens.append(f"{tokens[i+1]}_not")
+                        i += 2
+                    else:
+                        if token not in stopwords:
+                            filtered_tokens.append(token)
+                        i += 1
             
             # Add question indicator if there was a question mark
             if has_question_mark and filtered_tokens:
@@ -141,7 +273,7 @@ class NLPProcessor:
     
     def _expand_contractions(self, text):
         """
-        Expand common English contractions.
+        Expand common English contractions, in any letter case.
         
         Args:
             text (str): Text containing contractions
@@ -149,47 +281,12 @@ class NLPProcessor:
         Returns:
             str: Text with expanded contractions
         """
-        # Common contractions mapping
-        contractions = {
-            "can't": "cannot",
-            "won't": "will not",
-            "n't": " not",
-            "'ve": " have",
-            "'re": " are",
-            "'m": " am",
-            "'ll": " will",
-            "'d": " would",
-            "'s": " is"
-        }
+        # Every contraction has an apostrophe, so most text needs no scan at all
+        if "'" not in text:
+            return text
         
         # Replace contractions
-        for contraction, expansion in contractions.items():
-            text = text.replace(contraction, expansion)
-        
-        return text
-    
-    def _handle_negations(self, tokens):
-        """
-        Handle negations by combining 'not' with the following word.
-        
-        Args:
-            tokens (list): List of tokens
-            
-        Returns:
-            list: Tokens with handled negations
-        """
-        result = []
-        i = 0
-        while i < len(tokens):
-            if tokens[i] in ['not', 'no', 'never'] and i + 1 < len(tokens):
-                # Combine negation with the following word
-                result.append(f"{tokens[i+1]}_not")
-                i += 2
-            else:
-                result.append(tokens[i])
-                i += 1
-        
-        return result
+        return self._CONTRACTION_RE.sub(lambda match: self._CONTRACTIONS[match.group().lower()], text)
     
     def extract_keywords(self, text, n=5):
         """
@@ -202,27 +299,30 @@ class NLPProcessor:
         Returns:
             list: List of the most important keywords
         """
-        tokens = self.preprocess(text)
+        return list(self._extract_keywords_cached(text, n))
+    
+    def _extract_keywords(self, text, n):
+        """Extract keywords without the cache; see extract_keywords."""
+        # Reuse the cached preprocessing directly; the tokens are only read
+        tokens = self._preprocess_cached(text)
         
         # Count token frequencies
         token_counts = Counter(tokens)
         
-        # Apply a simple weight that prioritizes longer and less common words
-        weighted_tokens = {}
-        for token, count in token_counts.items():
-            # Formula: count * (length of word) - gives more weight to longer words
-            weighted_tokens[token] = count * min(len(token), 10) * 0.1
-            
-            # Boost domain-specific terms
-            for domain, terms in self.domain_terms.items():
-                if token in terms:
-                    weighted_tokens[token] *= 1.5
+        # Apply a simple weight that prioritizes longer and less common words.
+        # Formula: count * (length of word) - gives more weight to longer words,
+        # with domain-specific terms boosted
+        domain_boost = self._domain_boost
+        weighted_tokens = {
+            token: count * min(len(token), 10) * 0.1 * domain_boost.get(token, 1.0)
+            for token, count in token_counts.items()
+        }
         
-        # Sort by weight and take top n
-        sorted_tokens = sorted(weighted_tokens.items(), key=lambda x: x[1], reverse=True)
+        # Take the top n by weight without sorting every token
+        top_tokens = heapq.nlargest(n, weighted_tokens.items(), key=itemgetter(1))
         
         # Return just the keywords, not the weights
-        keywords = [keyword for keyword, _ in sorted_tokens[:n]]
+        keywords = [keyword for keyword, _ in top_tokens]
         
         # Add any missed domain terms that appear in the original text
         if len(keywords) < n:
@@ -248,13 +348,25 @@ class NLPProcessor:
         Returns:
             str: The detected intent or 'general_query' if no specific intent is found
         """
+        return self._detect_intent_cached(text)
+    
+    def _detect_intent(self, text):
+        """Detect the intent of text without the cache; see detect_intent."""
         if not text:
             return 'general_query'
             
         text_lower = text.lower()
         
+        intent = self._pattern_intents.get(text_lower)
+        if intent is not None:
+            return intent
+        
+        return self._match_intent(text_lower)
+    
+    def _match_intent(self, text_lower):
+        """Detect the intent of lowercased text by matching it against the intent patterns."""
         # Check for question marks (explicit questions)
-        is_question = '?' in text_lower or any(text_lower.startswith(starter) for starter in self.question_starters)
+        is_question = '?' in text_lower or text_lower.startswith(self.question_starters)
         
         # Check each intent pattern
         matched_intents = {}
@@ -323,35 +435,20 @@ class NLPProcessor:
         # Very simple pattern matching for demonstration purposes
         text_lower = text.lower()
         
-        # Extract dates using regex
-        date_patterns = [
-            r'\d{1,2}[-/]\d{1,2}[-/]\d{2,4}',  # DD/MM/YYYY or similar
-            r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]* \d{1,2}(st|nd|rd|th)?,? \d{2,4}',  # Month Day, Year
-            r'yesterday|today|tomorrow'  # Relative dates
-        ]
-        
-        for pattern in date_patterns:
-            matches = re.findall(pattern, text_lower)
-            if matches:
-                entities['dates'].extend(matches)
+        # Extract dates using regex, in the order they appear
+        entities['dates'] = self._DATE_RE.findall(text_lower)
         
         # Extract potential names (capitalized words not at the start of a sentence)
-        name_pattern = r'(?<!\. )[A-Z][a-z]+'
-        names = re.findall(name_pattern, text)
-        entities['names'] = [name for name in names if name.lower() not in self.stopwords]
+        stopwords = self.stopwords
+        entities['names'] = [name for name in self._NAME_RE.findall(text)
+                             if name.lower() not in stopwords]
         
         # Extract technical terms
-        for term_type, terms in self.domain_terms.items():
-            for term in terms:
-                if term in text_lower:
-                    entities['technical_terms'].append(term)
+        entities['technical_terms'] = [term for terms in self.domain_terms.values()
+                                       for term in terms if term in text_lower]
         
         # Extract action verbs
-        action_verbs = ['create', 'delete', 'update', 'add', 'remove', 'send', 'receive', 
-                        'build', 'design', 'develop', 'learn', 'explain', 'compare']
-        for verb in action_verbs:
-            if verb in text_lower:
-                entities['actions'].append(verb)
+        entities['actions'] = [verb for verb in self.action_verbs if verb in text_lower]
         
         return entities
     
@@ -365,28 +462,19 @@ class NLPProcessor:
         Returns:
             dict: Sentiment analysis with polarity score and labels
         """
+        return dict(self._analyze_sentiment_cached(text))
+    
+    def _analyze_sentiment(self, text):
+        """Analyze the sentiment of text without the cache; see analyze_sentiment."""
         text_lower = text.lower()
         
-        # Basic positive and negative word lists
-        positive_words = [
-            'good', 'great', 'excellent', 'amazing', 'wonderful', 'fantastic', 'helpful',
-            'useful', 'thank', 'thanks', 'appreciate', 'happy', 'glad', 'love', 'like',
-            'best', 'better', 'awesome', 'nice', 'well', 'positive', 'correct', 'right'
-        ]
+        # Count occurrences of whole words, so e.g. 'unlikely' doesn't count as 'like'
+        tokens = self._expand_contractions(text_lower).translate(self._PUNCT_TABLE).split()
+        positive_count = sum(1 for token in tokens if token in self.positive_words)
+        negative_count = sum(1 for token in tokens if token in self.negative_words)
         
-        negative_words = [
-            'bad', 'terrible', 'awful', 'horrible', 'poor', 'useless', 'unhelpful',
-            'wrong', 'hate', 'dislike', 'worst', 'worse', 'negative', 'error', 'fail',
-            'problem', 'issue', 'bug', 'difficult', 'hard', 'complicated', 'confused'
-        ]
-        
-        # Count occurrences
-        positive_count = sum(1 for word in positive_words if word in text_lower)
-        negative_count = sum(1 for word in negative_words if word in text_lower)
-        
-        # Check for negations
-        negations = ['not', 'no', 'never', 'cannot', 'shouldn\'t', 'wouldn\'t', 'don\'t', 'doesn\'t']
-        negation_count = sum(1 for neg in negations if neg in text_lower)
+        # Check for negations, also as whole words so e.g. 'know' doesn't count as 'no'
+        negation_count = sum(1 for token in tokens if token in self.sentiment_negations)
         
         # If there's an odd number of negations, it flips the sentiment
         if negation_count % 2 == 1:
@@ -414,6 +502,10 @@ class NLPProcessor:
             'negative_score': negative_count
         }
     
+    def _token_set(self, text):
+        """Get the set of preprocessed tokens of text, for similarity comparisons."""
+        return frozenset(self._preprocess_cached(text))
+    
     def get_context_relevance(self, query, context_messages, n=5):
         """
         Determine which context messages are most relevant to the current query.
@@ -429,25 +521,33 @@ class NLPProcessor:
         if not query or not context_messages:
             return []
             
-        query_tokens = self.preprocess(query)
+        query_tokens = self._token_set_cached(query)
+        recency_weights = self._RECENCY_WEIGHTS
+        last = len(context_messages) - 1
         
-        # Calculate relevance scores for each context message
+        # Calculate relevance scores for the user messages; bot messages have no
+        # relevance and can never be returned, so they are not scored at all
         relevance_scores = []
         for i, msg in enumerate(context_messages):
-            if msg.get('role') == 'user':
-                msg_tokens = self.preprocess(msg.get('content', ''))
-                similarity = self.calculate_similarity(query_tokens, msg_tokens)
-                
-                # Decay factor based on position (more recent = more relevant)
-                recency_factor = 1.0 - (0.1 * (len(context_messages) - i - 1))
-                recency_factor = max(0.1, recency_factor)  # Ensure minimum weight
-                
-                relevance_scores.append((i, similarity * recency_factor))
+            if msg.get('role') != 'user':
+                continue
+            
+            msg_tokens = self._token_set_cached(msg.get('content', ''))
+            
+            # Jaccard similarity of the token sets, as in calculate_similarity
+            if query_tokens and msg_tokens:
+                similarity = len(query_tokens & msg_tokens) / len(query_tokens | msg_tokens)
             else:
-                relevance_scores.append((i, 0))  # Bot messages get 0 relevance
+                similarity = 0.0
+            
+            # Decay factor based on position (more recent = more relevant)
+            age = last - i
+            recency_factor = recency_weights[age] if age < len(recency_weights) else 0.1
+            
+            relevance_scores.append((i, similarity * recency_factor))
         
-        # Sort by relevance score (descending)
-        relevance_scores.sort(key=lambda x: x[1], reverse=True)
+        # Take the top N by relevance score without sorting every message
+        top_scores = heapq.nlargest(n, relevance_scores, key=itemgetter(1))
         
         # Return indices of top N most relevant context messages
-        return [idx for idx, score in relevance_scores[:n] if score > 0]
+        return [idx for idx, score in top_scores if score > 0]
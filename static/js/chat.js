@@ -388,6 +388,7 @@ document.addEventListener('DOMContentLoaded', function() {
         saveToLocalStorage();
         
         // Send to backend API
+        const requestStartedAt = Date.now();
         fetch('/api/chat', {
             method: 'POST',
             headers: {
@@ -404,6 +405,11 @@ document.addEventListener('DOMContentLoaded', function() {
             }
             return response.json();
         })
+        .then(data => {
+            // Keep the typing indicator up for the suggested thinking time
+            const remaining = (data.thinking_ms || 0) - (Date.now() - requestStartedAt);
+            return new Promise(resolve => setTimeout(() => resolve(data), Math.max(0, remaining)));
+        })
         .then(data => {
             // Remove loading indicator
             loadingIndicator.remove();